@@ -13,8 +13,12 @@ from reportlab.pdfgen import canvas
 from tkinter import filedialog, messagebox
 
 from backend.ollama_client import OllamaClient
+from backend.model_manager import ModelManager
 from backend.semantic_cache import SemanticCache
+from backend.embedding_service import EmbeddingService
+from backend.embedding_backends import BACKENDS
 from backend.voice_handler import VoiceHandler
+from backend.resource_governor import GB, NVMLSource, ResourceGovernor, ResourceSampler
 from gui.chat_window import ChatWindow
 from utils.config import Config
 from utils.logger import setup_logger
@@ -25,10 +29,49 @@ class ChatApplication:
         self.config = Config()
         self.setup_theme()
         
+        # Resource sampling and model placement
+        self.resource_sampler = ResourceSampler(NVMLSource())
+        self.resource_sampler.start()
+        self.governor = ResourceGovernor(
+            self.resource_sampler,
+            vram_budget=int(self.config.get_vram_budget() * GB)
+        )
+        
         # Initialize components
-        self.ollama_client = OllamaClient(model_name="phi3-mini")
-        self.semantic_cache = SemanticCache()
-        self.voice_handler = VoiceHandler()
+        self.ollama_client = OllamaClient(
+            model_name=self.config.get_model_name(),
+            keep_alive=self.config.get_keep_alive(),
+            governor=self.governor
+        )
+        self.model_manager = ModelManager(self.ollama_client, keep_alive=self.config.get_keep_alive())
+        if self.config.is_warmup_enabled():
+            self.model_manager.warm_up()
+        self.embedding_service = None
+        embedding_device = self.governor.embedding_device(
+            copies=self.config.get_embedding_workers(),
+            cpu_only=BACKENDS[self.config.get_embedding_backend()].cpu_only,
+            name="embedding:service"
+        )
+        if self.config.get_embedding_workers() > 0 and embedding_device is not None:
+            self.embedding_service = EmbeddingService(
+                num_workers=self.config.get_embedding_workers(),
+                batch_window_ms=self.config.get_embedding_batch_window(),
+                backend=self.config.get_embedding_backend(),
+                num_threads=self.config.get_embedding_threads() or None,
+                device=embedding_device
+            )
+            if not self.embedding_service.start():
+                self.embedding_service = None
+                self.governor.release("embedding:service")
+            elif embedding_device == "cuda":
+                self.governor.mark_resident("embedding:service")
+        self.semantic_cache = SemanticCache(
+            embedding_service=self.embedding_service,
+            embedding_backend=self.config.get_embedding_backend(),
+            embedding_threads=self.config.get_embedding_threads() or None,
+            governor=self.governor
+        )
+        self.voice_handler = VoiceHandler(governor=self.governor)
         
         # Create main window
         self.root = ctk.CTk()
@@ -58,6 +101,9 @@ class ChatApplication:
     def run(self):
         """Start the application"""
         self.root.mainloop()
+        self.resource_sampler.stop()
+        if self.embedding_service is not None:
+            self.embedding_service.close()
         
     async def process_message(self, message: str) -> str:
         """Process incoming messages with caching and fallback"""
@@ -66,8 +112,10 @@ class ChatApplication:
             if not self.rate_limiter.check():
                 return "Rate limit exceeded. Please wait."
                 
-            # Check cache
-            cached_response = self.semantic_cache.get(message)
+            # Check cache (partitioned by model and temperature)
+            model = self.ollama_client.model
+            temperature = self.ollama_client.temperature
+            cached_response = self.semantic_cache.get(message, model=model, temperature=temperature)
             if cached_response:
                 return cached_response
                 
@@ -75,7 +123,7 @@ class ChatApplication:
             response = await self.ollama_client.generate(message)
             
             # Cache response
-            self.semantic_cache.add(message, response)
+            self.semantic_cache.add(message, response, model=model, temperature=temperature)
             
             return response
             
@@ -0,0 +1,70 @@
+from sentence_transformers import SentenceTransformer
+import numpy as np
+from typing import List, Optional, Union
+import os
+import torch
+
+DEFAULT_EMBEDDING_MODEL = "all-MiniLM-L6-v2"
+
+class SentenceTransformerBackend:
+    """Default embedding backend: the SentenceTransformer model as shipped"""
+
+    name = "default"
+    cpu_only = False
+
+    def __init__(self, model_name: str = DEFAULT_EMBEDDING_MODEL, num_threads: Optional[int] = None,
+                 device: Optional[str] = None):
+        if num_threads:
+            torch.set_num_threads(num_threads)
+        if device == "cuda" and not torch.cuda.is_available():
+            device = "cpu"
+        self.device = device
+        self.model = self.load_model(model_name)
+        if self.device is None:
+            self.device = "cuda" if torch.cuda.is_available() else "cpu"
+
+    def load_model(self, model_name: str) -> SentenceTransformer:
+        """Load the underlying SentenceTransformer"""
+        return SentenceTransformer(model_name, device=self.device)
+
+    def get_dimension(self) -> int:
+        """Get embedding dimension"""
+        return self.model.get_sentence_embedding_dimension()
+
+    def encode(self, texts: Union[str, List[str]], batch_size: int = 32) -> np.ndarray:
+        """Generate embedding(s) for a text or a list of texts"""
+        return self.model.encode(texts, batch_size=batch_size)
+
+class QuantizedCPUBackend(SentenceTransformerBackend):
+    """int8 dynamically quantized model for CPU-only hosts"""
+
+    name = "quantized"
+    cpu_only = True
+
+    def load_model(self, model_name: str) -> SentenceTransformer:
+        """Load model on CPU and quantize its Linear layers to int8"""
+        self.device = "cpu"
+        model = SentenceTransformer(model_name, device="cpu")
+        model.eval()
+        return torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+
+    def encode(self, texts: Union[str, List[str]], batch_size: int = 32) -> np.ndarray:
+        """Generate embedding(s) without autograd bookkeeping"""
+        with torch.inference_mode():
+            return self.model.encode(texts, batch_size=batch_size)
+
+BACKENDS = {
+    SentenceTransformerBackend.name: SentenceTransformerBackend,
+    QuantizedCPUBackend.name: QuantizedCPUBackend,
+}
+
+def default_num_threads(num_processes: int = 1) -> int:
+    """Split the available cores between embedding processes"""
+    return max(1, (os.cpu_count() or 1) // max(1, num_processes))
+
+def create_backend(name: str = "default", model_name: str = DEFAULT_EMBEDDING_MODEL,
+                   num_threads: Optional[int] = None, device: Optional[str] = None) -> SentenceTransformerBackend:
+    """Create embedding backend by name ("default" or "quantized")"""
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown embedding backend: {name}")
+    return BACKENDS[name](model_name, num_threads=num_threads, device=device)
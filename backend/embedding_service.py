@@ -0,0 +1,228 @@
+import atexit
+import itertools
+import multiprocessing as mp
+import queue
+import threading
+import time
+from multiprocessing import shared_memory
+from typing import Dict, List, Optional
+import numpy as np
+from backend.embedding_backends import create_backend, default_num_threads
+from utils.logger import setup_logger
+
+def _embedding_worker(model_name: str, backend: str, num_threads: Optional[int], device: Optional[str],
+                      shm_name: str, num_slots: int, embedding_dim: int, batch_window: float,
+                      max_batch_size: int, requests, results):
+    """Worker process: micro-batch queued texts into a single encode call"""
+    try:
+        model = create_backend(backend, model_name, num_threads=num_threads, device=device)
+        dim = model.get_dimension()
+        if dim != embedding_dim:
+            raise ValueError(f"Model dimension {dim} does not match embedding_dim {embedding_dim}")
+    except Exception as e:
+        results.put(("failed", None, str(e)))
+        return
+
+    shm = shared_memory.SharedMemory(name=shm_name)
+    buffer = np.ndarray((num_slots, embedding_dim), dtype=np.float32, buffer=shm.buf)
+    results.put(("ready", None, None))
+
+    running = True
+    while running:
+        item = requests.get()
+        if item is None:
+            break
+        batch = [item]
+        deadline = time.monotonic() + batch_window
+        while len(batch) < max_batch_size:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            try:
+                item = requests.get(timeout=timeout)
+            except queue.Empty:
+                break
+            if item is None:
+                running = False
+                break
+            batch.append(item)
+
+        try:
+            embeddings = model.encode([text for _, _, text in batch], batch_size=len(batch))
+            for (request_id, slot, _), embedding in zip(batch, embeddings):
+                buffer[slot] = embedding
+                results.put(("done", request_id, None))
+        except Exception as e:
+            for request_id, _, _ in batch:
+                results.put(("error", request_id, str(e)))
+
+    del buffer
+    shm.close()
+
+class EmbeddingService:
+    """Compute embeddings in worker processes, returning them through shared memory"""
+
+    def __init__(self, model_name: str = "all-MiniLM-L6-v2", num_workers: int = 1,
+                 embedding_dim: int = 384, batch_window_ms: float = 5, max_batch_size: int = 32,
+                 num_slots: int = 64, backend: str = "default", num_threads: Optional[int] = None,
+                 device: Optional[str] = None):
+        self.logger = setup_logger()
+        self.model_name = model_name
+        self.backend = backend
+        self.num_threads = num_threads
+        self.device = device
+        self.num_workers = max(1, num_workers)
+        self.embedding_dim = embedding_dim
+        self.batch_window = batch_window_ms / 1000
+        self.max_batch_size = max_batch_size
+        self.num_slots = num_slots
+        self.started = False
+        self.dispatcher = None
+        self.workers: List[mp.Process] = []
+        self.pending: Dict[int, list] = {}
+        self.lock = threading.Lock()
+        self.ids = itertools.count()
+
+    def start(self, timeout: float = 120) -> bool:
+        """Spawn workers and wait until at least one has loaded the model"""
+        if self.started:
+            return True
+        ctx = mp.get_context("spawn")
+        self.shm = shared_memory.SharedMemory(
+            create=True, size=self.num_slots * self.embedding_dim * 4
+        )
+        self.buffer = np.ndarray(
+            (self.num_slots, self.embedding_dim), dtype=np.float32, buffer=self.shm.buf
+        )
+        self.free_slots = queue.Queue()
+        for slot in range(self.num_slots):
+            self.free_slots.put(slot)
+        self.requests = ctx.Queue()
+        self.results = ctx.Queue()
+
+        for _ in range(self.num_workers):
+            worker = ctx.Process(
+                target=_embedding_worker,
+                args=(self.model_name, self.backend, self.num_threads or default_num_threads(self.num_workers),
+                      self.device, self.shm.name, self.num_slots, self.embedding_dim,
+                      self.batch_window, self.max_batch_size, self.requests, self.results),
+                daemon=True
+            )
+            worker.start()
+            self.workers.append(worker)
+
+        ready = 0
+        failed = 0
+        deadline = time.monotonic() + timeout
+        while ready == 0 and failed < self.num_workers and time.monotonic() < deadline:
+            try:
+                status, _, error = self.results.get(timeout=0.5)
+            except queue.Empty:
+                if not any(worker.is_alive() for worker in self.workers):
+                    break
+                continue
+            if status == "ready":
+                ready += 1
+            else:
+                failed += 1
+                self.logger.error(f"Embedding worker failed to start: {error}")
+
+        if ready == 0:
+            self.logger.error("Embedding service unavailable")
+            self.close()
+            return False
+
+        self.started = True
+        self.dispatcher = threading.Thread(target=self._dispatch, daemon=True)
+        self.dispatcher.start()
+        atexit.register(self.close)
+        self.logger.info(f"Embedding service started with {self.num_workers} worker(s)")
+        return True
+
+    def _dispatch(self):
+        """Wake up callers as their embeddings become available"""
+        while True:
+            try:
+                status, request_id, error = self.results.get()
+            except (EOFError, OSError):
+                break
+            if status == "stop":
+                break
+            if status in ("ready", "failed"):
+                continue
+            with self.lock:
+                entry = self.pending.get(request_id)
+            if entry is not None:
+                entry[1] = error
+                entry[0].set()
+
+    def check_workers(self):
+        """Stop the service as soon as a worker process dies so callers fail fast"""
+        if self.started and not all(worker.is_alive() for worker in self.workers):
+            # A dead worker may have taken queued requests with it
+            self.started = False
+            self.logger.error("Embedding worker died, stopping embedding service")
+        if not self.started:
+            raise RuntimeError("Embedding service not running")
+
+    def encode(self, text: str, timeout: float = 30, poll_interval: float = 0.5) -> np.ndarray:
+        """Get embedding for text from the worker pool"""
+        self.check_workers()
+        deadline = time.monotonic() + timeout
+
+        while True:
+            try:
+                slot = self.free_slots.get(timeout=poll_interval)
+                break
+            except queue.Empty:
+                self.check_workers()
+                if time.monotonic() >= deadline:
+                    raise TimeoutError("No free embedding slot")
+
+        request_id = next(self.ids)
+        entry = [threading.Event(), None]
+        with self.lock:
+            self.pending[request_id] = entry
+        try:
+            self.requests.put((request_id, slot, text))
+            while not entry[0].wait(poll_interval):
+                self.check_workers()
+                if time.monotonic() >= deadline:
+                    raise TimeoutError("Embedding request timed out")
+            if entry[1] is not None:
+                raise RuntimeError(entry[1])
+            return self.buffer[slot].copy()
+        finally:
+            with self.lock:
+                self.pending.pop(request_id, None)
+            # A timed out slot may still be written by a worker, so it is not reused
+            if entry[0].is_set():
+                self.free_slots.put(slot)
+
+    def restart(self, device: Optional[str]) -> bool:
+        """Reload the workers on another device, or just stop them when device is None"""
+        self.close()
+        self.device = device
+        if device is None:
+            self.logger.info("Embedding service stopped to free memory")
+            return False
+        return self.start()
+
+    def close(self):
+        """Stop workers and release shared memory"""
+        if not self.workers:
+            return
+        for _ in self.workers:
+            self.requests.put(None)
+        for worker in self.workers:
+            worker.join(timeout=5)
+            if worker.is_alive():
+                worker.terminate()
+        self.workers = []
+        self.started = False
+        if self.dispatcher is not None:
+            self.results.put(("stop", None, None))
+            self.dispatcher = None
+        del self.buffer
+        self.shm.close()
+        self.shm.unlink()
@@ -0,0 +1,162 @@
+import aiohttp
+import asyncio
+import threading
+import time
+from typing import Dict, List, Optional, Union
+from utils.logger import setup_logger
+
+class ModelManager:
+    """Keep Ollama models resident and measure cold vs warm time-to-first-token"""
+
+    def __init__(self, client, keep_alive: Union[str, int] = "30m"):
+        self.logger = setup_logger()
+        self.client = client
+        self.base_url = client.base_url
+        self.keep_alive = keep_alive
+        self.client.keep_alive = keep_alive
+        self.client.on_first_token = self.record_ttft
+        self.last_used: Dict[str, float] = {}
+        self.pending: Dict[str, threading.Thread] = {}
+        self.ttft: Dict[str, List[float]] = {"cold": [], "warm": []}
+        self.lock = threading.Lock()
+        if client.governor is not None:
+            client.governor.sampler.add_listener(self.check_placement)
+
+    def keep_alive_seconds(self) -> Optional[float]:
+        """Convert keep_alive into seconds (None means the model never unloads)"""
+        value = self.keep_alive
+        if isinstance(value, (int, float)):
+            return None if value < 0 else float(value)
+        value = str(value).strip()
+        units = {"s": 1, "m": 60, "h": 3600}
+        try:
+            if value and value[-1] in units:
+                seconds = float(value[:-1]) * units[value[-1]]
+            else:
+                seconds = float(value)
+        except ValueError:
+            self.logger.warning(f"Invalid keep_alive value: {value}")
+            return 300.0
+        return None if seconds < 0 else seconds
+
+    def is_warm(self, model_name: str) -> bool:
+        """Check if model should still be resident in Ollama"""
+        with self.lock:
+            last_used = self.last_used.get(model_name)
+        if last_used is None:
+            return False
+        keep_alive = self.keep_alive_seconds()
+        return keep_alive is None or time.monotonic() - last_used < keep_alive
+
+    def mark_used(self, model_name: str):
+        """Register that the model has just been loaded or used"""
+        with self.lock:
+            self.last_used[model_name] = time.monotonic()
+
+    async def _load(self, model_name: str) -> bool:
+        """Ask Ollama to load the model without generating anything"""
+        payload = {
+            "model": model_name,
+            "prompt": "",
+            "stream": False,
+            "keep_alive": self.keep_alive
+        }
+        # Same placement as generate(), otherwise Ollama reloads the model on first message
+        governor = self.client.governor
+        num_gpu = governor.ollama_num_gpu(model_name) if governor is not None else None
+        if num_gpu is not None:
+            payload["options"] = {"num_gpu": num_gpu}
+        start = time.perf_counter()
+        try:
+            async with aiohttp.ClientSession() as session:
+                async with session.post(f"{self.base_url}/generate", json=payload) as response:
+                    if response.status != 200:
+                        raise Exception(f"Ollama API error: {response.status}")
+                    await response.read()
+        except Exception as e:
+            self.logger.error(f"Error warming up model {model_name}: {str(e)}")
+            return False
+
+        self.mark_used(model_name)
+        if self.client.governor is not None:
+            self.client.governor.mark_resident(f"llm:{model_name}")
+        self.logger.info(f"Model {model_name} loaded in {time.perf_counter() - start:.2f}s")
+        return True
+
+    def warm_up(self, model_name: Optional[str] = None) -> threading.Thread:
+        """Load model in a background thread"""
+        model_name = model_name or self.client.model
+        with self.lock:
+            thread = self.pending.get(model_name)
+            if thread is not None and thread.is_alive():
+                return thread
+
+            def run():
+                loop = asyncio.new_event_loop()
+                asyncio.set_event_loop(loop)
+                try:
+                    loop.run_until_complete(self._load(model_name))
+                finally:
+                    loop.close()
+                    with self.lock:
+                        self.pending.pop(model_name, None)
+
+            thread = threading.Thread(target=run, daemon=True)
+            self.pending[model_name] = thread
+        thread.start()
+        return thread
+
+    def prefetch(self, model_name: str) -> Optional[threading.Thread]:
+        """Preload a model the user is about to switch to"""
+        if self.is_warm(model_name):
+            return None
+        self.logger.info(f"Prefetching model {model_name}")
+        return self.warm_up(model_name)
+
+    def switch_model(self, model_name: str):
+        """Switch the client to another model, preloading it first"""
+        governor = self.client.governor
+        if governor is not None and model_name != self.client.model:
+            # Ollama evicts the old model to make room, so its VRAM goes back to the budget
+            governor.reset_placement(self.client.model)
+            if not self.is_warm(model_name):
+                governor.reset_placement(model_name)
+        self.prefetch(model_name)
+        self.client.set_model(model_name)
+
+    def check_placement(self, snapshot: Dict[str, int]):
+        """Resource sampler listener: release expired models and reload after a placement change"""
+        governor = self.client.governor
+        with self.lock:
+            expired = [name for name in self.last_used if name not in self.pending]
+        for model_name in expired:
+            if not self.is_warm(model_name):
+                # keep_alive elapsed, Ollama has unloaded the model
+                with self.lock:
+                    self.last_used.pop(model_name, None)
+                governor.reset_placement(model_name)
+
+        # Placement was upgraded (VRAM freed up): reload now instead of on the next message
+        model_name = self.client.model
+        if governor.take_reload(model_name) and self.is_warm(model_name):
+            self.warm_up(model_name)
+
+    def record_ttft(self, model_name: str, seconds: float):
+        """Record time-to-first-token as cold or warm start"""
+        kind = "warm" if self.is_warm(model_name) else "cold"
+        self.mark_used(model_name)
+        with self.lock:
+            self.ttft[kind].append(seconds)
+        self.logger.info(f"TTFT ({kind}) for {model_name}: {seconds:.2f}s")
+
+    def get_ttft_stats(self) -> Dict[str, Dict[str, float]]:
+        """Get count and average TTFT for cold and warm starts"""
+        with self.lock:
+            samples = {kind: list(values) for kind, values in self.ttft.items()}
+        return {
+            kind: {
+                "count": len(values),
+                "avg": sum(values) / len(values) if values else 0.0
+            }
+            for kind, values in samples.items()
+        }
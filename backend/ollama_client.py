@@ -1,54 +1,38 @@
 import aiohttp
 import json
 import asyncio
-from typing import AsyncGenerator, Optional
+import time
+from typing import AsyncGenerator, Callable, Optional, Union
 import logging
-import pynvml
 from utils.logger import setup_logger
 
 class OllamaClient:
-    def __init__(self, model_name="phi3-mini"):
+    def __init__(self, model_name="phi3-mini", keep_alive: Union[str, int] = "30m", governor=None):
         self.logger = setup_logger()
         self.base_url = "http://localhost:11434/api"
         self.model = model_name
         self.temperature = 0.7
         self.max_tokens = 2048
-        self.setup_gpu_monitoring()
-        
-    def setup_gpu_monitoring(self):
-        """Initialize GPU monitoring"""
-        try:
-            pynvml.nvmlInit()
-            self.has_gpu = True
-        except:
-            self.has_gpu = False
-            self.logger.warning("No NVIDIA GPU detected, falling back to CPU mode")
-            
-    def check_gpu_memory(self) -> bool:
-        """Check if GPU has enough memory"""
-        if not self.has_gpu:
-            return False
-            
-        try:
-            handle = pynvml.nvmlDeviceGetHandleByIndex(0)
-            info = pynvml.nvmlDeviceGetMemoryInfo(handle)
-            return info.free > 2 * 1024 * 1024 * 1024  # 2GB free
-        except:
-            return False
+        self.keep_alive = keep_alive
+        self.on_first_token: Optional[Callable[[str, float], None]] = None
+        self.governor = governor
             
     async def generate(self, prompt: str) -> AsyncGenerator[str, None]:
         """Generate response from Ollama with streaming"""
-        if self.has_gpu and not self.check_gpu_memory():
-            self.logger.warning("GPU memory low, falling back to CPU mode")
-            
         async with aiohttp.ClientSession() as session:
             payload = {
                 "model": self.model,
                 "prompt": prompt,
                 "stream": True,
                 "temperature": self.temperature,
-                "max_tokens": self.max_tokens
+                "max_tokens": self.max_tokens,
+                "keep_alive": self.keep_alive
             }
+            num_gpu = self.governor.ollama_num_gpu(self.model) if self.governor is not None else None
+            if num_gpu is not None:
+                payload["options"] = {"num_gpu": num_gpu}
+            start = time.perf_counter()
+            first_token = True
             
             try:
                 async with session.post(f"{self.base_url}/generate", json=payload) as response:
@@ -60,6 +44,12 @@ class OllamaClient:
                             try:
                                 data = json.loads(line)
                                 if "response" in data:
+                                    if first_token:
+                                        if self.on_first_token:
+                                            self.on_first_token(payload["model"], time.perf_counter() - start)
+                                        if self.governor is not None:
+                                            self.governor.mark_resident(f"llm:{payload['model']}")
+                                    first_token = False
                                     yield data["response"]
                             except json.JSONDecodeError:
                                 continue
@@ -0,0 +1,295 @@
+import threading
+import time
+from typing import Callable, Dict, List, Optional
+import psutil
+import pynvml
+import torch
+from utils.logger import setup_logger
+
+GB = 1024 * 1024 * 1024
+MB = 1024 * 1024
+
+class NVMLSource:
+    """Read free/total VRAM through NVML and RAM through psutil"""
+
+    def __init__(self, device_index: int = 0):
+        self.logger = setup_logger()
+        self.device_index = device_index
+        try:
+            pynvml.nvmlInit()
+            self.handle = pynvml.nvmlDeviceGetHandleByIndex(device_index)
+            self.has_gpu = True
+        except Exception:
+            self.handle = None
+            self.has_gpu = False
+            self.logger.warning("No NVIDIA GPU detected, falling back to CPU mode")
+
+    def read(self) -> Dict[str, int]:
+        """Take one reading of GPU and system memory (bytes)"""
+        ram = psutil.virtual_memory()
+        snapshot = {"gpu_total": 0, "gpu_free": 0, "ram_total": ram.total, "ram_free": ram.available}
+        if self.has_gpu:
+            try:
+                info = pynvml.nvmlDeviceGetMemoryInfo(self.handle)
+                snapshot["gpu_total"] = info.total
+                snapshot["gpu_free"] = info.free
+            except Exception as e:
+                self.logger.error(f"Error reading GPU memory: {str(e)}")
+        return snapshot
+
+class FakeNVMLSource:
+    """Configurable memory readings for machines without a GPU"""
+
+    def __init__(self, gpu_total: int = 0, gpu_free: int = 0, ram_total: int = 16 * GB,
+                 ram_free: int = 8 * GB):
+        self.has_gpu = gpu_total > 0
+        self.gpu_total = gpu_total
+        self.gpu_free = gpu_free
+        self.ram_total = ram_total
+        self.ram_free = ram_free
+
+    def read(self) -> Dict[str, int]:
+        """Return the configured readings"""
+        return {
+            "gpu_total": self.gpu_total,
+            "gpu_free": self.gpu_free,
+            "ram_total": self.ram_total,
+            "ram_free": self.ram_free
+        }
+
+class ResourceSampler:
+    """Sample a memory source in the background and cache the latest reading"""
+
+    def __init__(self, source=None, interval: float = 2.0):
+        self.logger = setup_logger()
+        self.source = source if source is not None else NVMLSource()
+        self.interval = interval
+        self.listeners: List[Callable[[Dict[str, int]], None]] = []
+        self.stop_event = threading.Event()
+        self.thread = None
+        self.lock = threading.Lock()
+        self.snapshot = self.sample()
+
+    @property
+    def has_gpu(self) -> bool:
+        return self.source.has_gpu
+
+    def sample(self) -> Dict[str, int]:
+        """Take a fresh reading and notify listeners"""
+        snapshot = self.source.read()
+        snapshot["timestamp"] = time.monotonic()
+        with self.lock:
+            self.snapshot = snapshot
+        for listener in list(self.listeners):
+            try:
+                listener(snapshot)
+            except Exception as e:
+                self.logger.error(f"Error in resource listener: {str(e)}")
+        return snapshot
+
+    def latest(self) -> Dict[str, int]:
+        """Get the cached reading (no NVML call)"""
+        with self.lock:
+            return dict(self.snapshot)
+
+    def add_listener(self, listener: Callable[[Dict[str, int]], None]):
+        """Call listener after every sample"""
+        self.listeners.append(listener)
+
+    def start(self):
+        """Start background sampling"""
+        if self.thread is not None and self.thread.is_alive():
+            return
+
+        def run():
+            while not self.stop_event.wait(self.interval):
+                self.sample()
+
+        self.stop_event.clear()
+        self.thread = threading.Thread(target=run, daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        """Stop background sampling"""
+        self.stop_event.set()
+
+class ResourceGovernor:
+    """Decide where the LLM, Whisper and the embedding model run from cached readings"""
+
+    def __init__(self, sampler: ResourceSampler, vram_budget: int = 6 * GB,
+                 vram_reserve: int = 512 * MB, llm_vram: int = int(2.5 * GB), llm_layers: int = 32,
+                 whisper_vram: int = 512 * MB, embedding_vram: int = 256 * MB,
+                 embedding_ram: int = 512 * MB, min_free_ram: int = 512 * MB,
+                 cuda_available: Optional[bool] = None):
+        self.logger = setup_logger()
+        self.sampler = sampler
+        self.vram_budget = vram_budget
+        self.vram_reserve = vram_reserve
+        self.llm_vram = llm_vram
+        self.llm_layers = llm_layers
+        self.whisper_vram = whisper_vram
+        self.embedding_vram = embedding_vram
+        self.embedding_ram = embedding_ram
+        self.min_free_ram = min_free_ram
+        # NVML can see a GPU that a CPU-only torch build cannot use (Whisper, embeddings)
+        if cuda_available is None:
+            cuda_available = torch.cuda.is_available()
+        self.cuda_available = cuda_available
+        # Changing num_gpu makes Ollama reload the model, so keep one decision per model
+        self.num_gpu: Dict[str, int] = {}
+        # VRAM handed out: name -> [bytes, time the workload became resident or None]
+        self.allocations: Dict[str, list] = {}
+        # Models whose placement was upgraded and must be reloaded to take effect
+        self.reload_needed = set()
+        self.lock = threading.Lock()
+        self.sampler.add_listener(self.rebalance)
+
+    @property
+    def has_gpu(self) -> bool:
+        return self.sampler.has_gpu
+
+    def allocate(self, name: str, size: int):
+        """Record VRAM handed to a workload that is about to load"""
+        with self.lock:
+            allocation = self.allocations.get(name)
+            if allocation is not None and allocation[0] == size:
+                return
+            self.allocations[name] = [size, None]
+
+    def mark_resident(self, name: str):
+        """Record that a workload has finished loading, so readings include its VRAM"""
+        with self.lock:
+            allocation = self.allocations.get(name)
+            if allocation is not None and allocation[1] is None:
+                allocation[1] = time.monotonic()
+
+    def release(self, name: str):
+        """Forget the VRAM handed to a workload that was unloaded"""
+        with self.lock:
+            self.allocations.pop(name, None)
+
+    def usable_vram(self, snapshot: Optional[Dict[str, int]] = None, exclude: Optional[str] = None) -> int:
+        """VRAM left for a new workload: budget minus what was handed out, capped by free memory"""
+        snapshot = snapshot or self.sampler.latest()
+        if not self.has_gpu:
+            return 0
+        allocated = 0
+        pending = 0
+        with self.lock:
+            for name, (size, resident_at) in self.allocations.items():
+                if name == exclude:
+                    # Its memory would be given back, and the reading already counts it as used
+                    if resident_at is not None and resident_at <= snapshot["timestamp"]:
+                        pending -= size
+                    continue
+                allocated += size
+                # Not yet visible in this reading, so gpu_free still includes it
+                if resident_at is None or resident_at > snapshot["timestamp"]:
+                    pending += size
+        within_budget = min(self.vram_budget, snapshot["gpu_total"]) - allocated
+        physically_free = snapshot["gpu_free"] - pending
+        return max(0, min(within_budget, physically_free) - self.vram_reserve)
+
+    def ollama_num_gpu(self, model_name: str) -> Optional[int]:
+        """Number of model layers Ollama should offload to the GPU (None lets Ollama decide)"""
+        with self.lock:
+            if model_name in self.num_gpu:
+                return self.num_gpu[model_name]
+        snapshot = self.sampler.latest()
+        if not self.has_gpu or snapshot["gpu_total"] == 0:
+            # No NVML reading (AMD, Apple, init or read failure): Ollama may still have a GPU.
+            # Nothing is stored, so the next request decides again from a good reading
+            return None
+        usable = self.usable_vram(snapshot, exclude=f"llm:{model_name}")
+        if usable >= self.llm_vram:
+            layers = self.llm_layers
+        else:
+            layers = int(self.llm_layers * usable / self.llm_vram)
+        with self.lock:
+            layers = self.num_gpu.setdefault(model_name, layers)
+        self.allocate(f"llm:{model_name}", self.llm_vram * layers // self.llm_layers)
+        self.logger.info(f"Placing {layers}/{self.llm_layers} layers of {model_name} on GPU")
+        return layers
+
+    def rebalance(self, snapshot: Dict[str, int]):
+        """Upgrade partial LLM placements once the whole model fits"""
+        with self.lock:
+            partial = [name for name, layers in self.num_gpu.items() if layers < self.llm_layers]
+        for model_name in partial:
+            if self.usable_vram(snapshot, exclude=f"llm:{model_name}") >= self.llm_vram:
+                # Decide the full placement here, with the credit for the memory the partial
+                # model holds; recomputing at reload time would lose that credit
+                with self.lock:
+                    self.num_gpu[model_name] = self.llm_layers
+                    self.allocations[f"llm:{model_name}"] = [self.llm_vram, None]
+                    self.reload_needed.add(model_name)
+                self.logger.info(f"VRAM freed up, {model_name} will be reloaded with all layers on GPU")
+
+    def take_reload(self, model_name: str) -> bool:
+        """Check (once) whether the model must be reloaded to apply a new placement"""
+        with self.lock:
+            if model_name in self.reload_needed:
+                self.reload_needed.discard(model_name)
+                return True
+            return False
+
+    def reset_placement(self, model_name: Optional[str] = None):
+        """Forget layer decisions so they are recomputed on next request"""
+        with self.lock:
+            models = list(self.num_gpu) if model_name is None else [model_name]
+            for name in models:
+                self.num_gpu.pop(name, None)
+                self.allocations.pop(f"llm:{name}", None)
+                self.reload_needed.discard(name)
+
+    def remaining_vram(self, snapshot: Optional[Dict[str, int]] = None, exclude: Optional[str] = None) -> int:
+        """VRAM for secondary workloads, keeping room for the LLM until its layers have been placed"""
+        usable = self.usable_vram(snapshot, exclude)
+        with self.lock:
+            llm_pending = not self.num_gpu
+            llm_partial = any(layers < self.llm_layers for layers in self.num_gpu.values())
+        if llm_partial:
+            # A partially offloaded LLM would use any VRAM we free up
+            return 0
+        if llm_pending:
+            usable -= self.llm_vram
+        return max(0, usable)
+
+    def whisper_device(self) -> str:
+        """Choose Whisper device, leaving room for the LLM"""
+        usable = self.remaining_vram(exclude="whisper")
+        device = "cuda" if self.cuda_available and usable >= self.whisper_vram else "cpu"
+        if device == "cuda":
+            self.allocate("whisper", self.whisper_vram)
+        else:
+            self.release("whisper")
+        self.logger.info(f"Whisper placed on {device}")
+        return device
+
+    def embedding_device(self, current: Optional[str] = None, copies: int = 1,
+                         cpu_only: bool = False, name: str = "embedding:local") -> Optional[str]:
+        """Choose embedding model device, or None when it should be unloaded"""
+        # The worker pool ("embedding:service") and the in-process model ("embedding:local")
+        # are placed separately, so each keeps its own allocation and resident state
+        cpu_only = cpu_only or not self.cuda_available
+        snapshot = self.sampler.latest()
+        needed = self.embedding_vram * copies
+        ram_free = snapshot["ram_free"]
+
+        # Keep the current placement unless memory is really short (hysteresis)
+        if current == "cuda" and self.usable_vram(snapshot, exclude=name) >= needed:
+            device = "cuda"
+        elif current == "cpu" and ram_free >= self.min_free_ram:
+            device = "cpu"
+        elif not cpu_only and self.remaining_vram(snapshot, exclude=name) >= needed:
+            device = "cuda"
+        elif ram_free >= self.embedding_ram * copies + self.min_free_ram:
+            device = "cpu"
+        else:
+            device = None
+
+        if device == "cuda":
+            self.allocate(name, needed)
+        else:
+            self.release(name)
+        return device
@@ -1,19 +1,48 @@
 import sqlite3
-from sentence_transformers import SentenceTransformer
+from backend.embedding_backends import BACKENDS, create_backend
 import numpy as np
-from typing import Optional, Tuple
+from typing import Dict, List, Optional, Tuple
+import hashlib
 import json
+import math
+import threading
+import time
+import torch
 from utils.logger import setup_logger
 import os
 
 class SemanticCache:
-    def __init__(self, db_path: str = "cache/chat_cache.db", similarity_threshold: float = 0.85):
+    def __init__(self, db_path: str = "cache/chat_cache.db", similarity_threshold: float = 0.85,
+                 embedding_service=None, temperature_step: float = 0.2,
+                 embedding_backend: str = "default", embedding_threads: Optional[int] = None,
+                 governor=None):
         # Garante que a pasta existe antes de criar o banco
         os.makedirs(os.path.dirname(db_path), exist_ok=True)
         self.logger = setup_logger()
         self.similarity_threshold = similarity_threshold
         self.db_path = db_path
-        self.model = SentenceTransformer('all-MiniLM-L6-v2')
+        self.embedding_service = embedding_service
+        self.temperature_step = temperature_step
+        # Per-partition in-memory index: partition -> (normalized embeddings, responses)
+        self.partitions: Dict[str, Tuple[np.ndarray, List[str]]] = {}
+        # One lock per partition serializes loading with inserts into that partition
+        self.partition_locks: Dict[str, threading.Lock] = {}
+        self.lock = threading.Lock()
+        self.embedding_backend = embedding_backend
+        self.embedding_threads = embedding_threads
+        self.governor = governor
+        self.model = None
+        self.model_lock = threading.Lock()
+        self.service_restarting = False
+        self.service_failed_at = None
+        self.service_retry_interval = 60
+        if embedding_service is None:
+            try:
+                self.load_model()
+            except RuntimeError as e:
+                self.logger.warning(str(e))
+        if governor is not None:
+            governor.sampler.add_listener(self.follow_governor)
         self.setup_database()
         
     def setup_database(self):
@@ -28,10 +57,17 @@ class SemanticCache:
                     prompt TEXT NOT NULL,
                     response TEXT NOT NULL,
                     embedding BLOB NOT NULL,
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    partition TEXT NOT NULL DEFAULT 'legacy'
                 )
             ''')
             
+            # Bancos antigos não têm a coluna de partição
+            columns = [row[1] for row in cursor.execute("PRAGMA table_info(cache)")]
+            if "partition" not in columns:
+                cursor.execute("ALTER TABLE cache ADD COLUMN partition TEXT NOT NULL DEFAULT 'legacy'")
+            cursor.execute("CREATE INDEX IF NOT EXISTS idx_cache_partition ON cache (partition)")
+            
             conn.commit()
             conn.close()
             
@@ -40,63 +76,243 @@ class SemanticCache:
             
     def get_embedding(self, text: str) -> np.ndarray:
         """Generate embedding for text"""
-        return self.model.encode(text)
+        if self.embedding_service is not None:
+            if self.service_restarting:
+                # Don't load a second copy in-process while the workers reload
+                raise RuntimeError("Embedding service restarting")
+            try:
+                return self.embedding_service.encode(text)
+            except Exception as e:
+                self.logger.warning(f"Embedding service failed, encoding in-process: {str(e)}")
+        with self.model_lock:
+            self.load_model()
+            return self.model.encode(text)
+        
+    def load_model(self):
+        """Load, move or unload the in-process embedding model as the governor decides"""
+        device = None
+        if self.governor is not None:
+            current = self.model.device if self.model is not None else None
+            device = self.governor.embedding_device(
+                current, cpu_only=BACKENDS[self.embedding_backend].cpu_only, name="embedding:local"
+            )
+            if device is None:
+                self.unload_model()
+                raise RuntimeError("Not enough memory to load the embedding model")
+            if self.model is not None and device != current:
+                self.logger.info(f"Moving embedding model from {current} to {device}")
+                self.unload_model()
+                
+        if self.model is None:
+            self.model = create_backend(
+                self.embedding_backend, num_threads=self.embedding_threads, device=device
+            )
+            if self.governor is not None and self.model.device == "cuda":
+                self.governor.mark_resident("embedding:local")
+            
+    def follow_governor(self, snapshot):
+        """Resource sampler listener: move, reload or stop embedding models as memory changes"""
+        if self.model is not None and self.model_lock.acquire(blocking=False):
+            try:
+                self.load_model()
+            except RuntimeError as e:
+                self.logger.warning(str(e))
+            finally:
+                self.model_lock.release()
+                
+        service = self.embedding_service
+        if service is None or self.service_restarting:
+            return
+        current = service.device if service.started else None
+        device = self.governor.embedding_device(
+            current, copies=service.num_workers, cpu_only=BACKENDS[service.backend].cpu_only,
+            name="embedding:service"
+        )
+        if service.started and device == service.device:
+            return
+        if not service.started:
+            if device is None:
+                return
+            if self.service_failed_at is not None and \
+                    time.monotonic() - self.service_failed_at < self.service_retry_interval:
+                self.governor.release("embedding:service")
+                return
+                
+        def restart():
+            try:
+                self.logger.info(f"Moving embedding service from {current} to {device}")
+                if service.restart(device):
+                    self.service_failed_at = None
+                    # The in-process fallback is no longer needed
+                    with self.model_lock:
+                        self.unload_model()
+                    if device == "cuda":
+                        self.governor.mark_resident("embedding:service")
+                else:
+                    self.governor.release("embedding:service")
+                    if device is not None:
+                        self.service_failed_at = time.monotonic()
+            finally:
+                self.service_restarting = False
+                
+        self.service_restarting = True
+        threading.Thread(target=restart, daemon=True).start()
+        
+    def unload_model(self):
+        """Release the in-process embedding model"""
+        if self.model is None:
+            return
+        on_gpu = self.model.device == "cuda"
+        self.model = None
+        if on_gpu:
+            torch.cuda.empty_cache()
+            if self.governor is not None:
+                self.governor.release("embedding:local")
+        self.logger.info("Embedding model unloaded")
         
     def cosine_similarity(self, a: np.ndarray, b: np.ndarray) -> float:
         """Calculate cosine similarity between two embeddings"""
         return np.dot(a, b) / (np.linalg.norm(a) * np.linalg.norm(b))
         
-    def get(self, prompt: str) -> Optional[str]:
-        """Get cached response if similar prompt exists"""
-        try:
-            prompt_embedding = self.get_embedding(prompt)
+    def partition_key(self, model: str, temperature: float, profile: Optional[str] = None) -> str:
+        """Build partition name from model, temperature bucket and system prompt/profile"""
+        bucket = round(math.floor(temperature / self.temperature_step + 1e-6) * self.temperature_step, 2)
+        profile_id = "default"
+        if profile:
+            profile_id = hashlib.sha1(profile.encode("utf-8")).hexdigest()[:12]
+        return f"{model}|t{bucket}|{profile_id}"
+        
+    def partition_lock(self, partition: str) -> threading.Lock:
+        """Get the lock guarding load and insert for a partition"""
+        with self.lock:
+            return self.partition_locks.setdefault(partition, threading.Lock())
             
+    def warm_partition(self, partition: str) -> Tuple[np.ndarray, List[str]]:
+        """Load partition index from the database into memory"""
+        with self.lock:
+            if partition in self.partitions:
+                return self.partitions[partition]
+                
+        with self.partition_lock(partition):
+            with self.lock:
+                if partition in self.partitions:
+                    return self.partitions[partition]
+                    
+            embeddings, responses = [], []
             conn = sqlite3.connect(self.db_path)
+            try:
+                cursor = conn.cursor()
+                cursor.execute(
+                    "SELECT response, embedding FROM cache WHERE partition = ? ORDER BY id",
+                    (partition,)
+                )
+                for response, embedding in cursor.fetchall():
+                    embeddings.append(np.frombuffer(embedding, dtype=np.float32))
+                    responses.append(response)
+            finally:
+                conn.close()
+                
+            matrix = self.normalize(np.vstack(embeddings)) if embeddings else None
+            with self.lock:
+                self.partitions[partition] = (matrix, responses)
+        self.logger.info(f"Loaded cache partition {partition} ({len(responses)} entries)")
+        return matrix, responses
+        
+    def evict_partition(self, partition: str):
+        """Drop partition index from memory (entries stay in the database)"""
+        with self.lock:
+            self.partitions.pop(partition, None)
+            
+    def clear_partition(self, partition: str):
+        """Delete all entries of a partition"""
+        with self.partition_lock(partition):
+            self.evict_partition(partition)
+            try:
+                conn = sqlite3.connect(self.db_path)
+                cursor = conn.cursor()
+                cursor.execute("DELETE FROM cache WHERE partition = ?", (partition,))
+                conn.commit()
+            except Exception as e:
+                self.logger.error(f"Error clearing cache partition: {str(e)}")
+            finally:
+                conn.close()
+            
+    def list_partitions(self) -> Dict[str, int]:
+        """Get number of entries per partition"""
+        conn = sqlite3.connect(self.db_path)
+        try:
             cursor = conn.cursor()
+            cursor.execute("SELECT partition, COUNT(*) FROM cache GROUP BY partition")
+            return dict(cursor.fetchall())
+        finally:
+            conn.close()
             
-            cursor.execute("SELECT prompt, response, embedding FROM cache")
-            results = cursor.fetchall()
+    @staticmethod
+    def normalize(embeddings: np.ndarray) -> np.ndarray:
+        """Scale embeddings to unit length so a dot product is the cosine similarity"""
+        embeddings = np.asarray(embeddings, dtype=np.float32)
+        norms = np.linalg.norm(embeddings, axis=-1, keepdims=True)
+        return embeddings / np.maximum(norms, 1e-12)
+        
+    def get(self, prompt: str, model: str = "", temperature: float = 0.7,
+            profile: Optional[str] = None) -> Optional[str]:
+        """Get cached response if similar prompt exists in the same partition"""
+        try:
+            partition = self.partition_key(model, temperature, profile)
+            matrix, responses = self.warm_partition(partition)
+            if matrix is None:
+                return None
+                
+            prompt_embedding = self.normalize(self.get_embedding(prompt))
+            similarities = matrix @ prompt_embedding
+            best = int(np.argmax(similarities))
+            similarity = float(similarities[best])
             
-            for cached_prompt, response, cached_embedding in results:
-                cached_embedding = np.frombuffer(cached_embedding, dtype=np.float32)
-                similarity = self.cosine_similarity(prompt_embedding, cached_embedding)
+            if similarity >= self.similarity_threshold:
+                self.logger.info(f"Cache hit with similarity {similarity:.2f} in {partition}")
+                return responses[best]
                 
-                if similarity >= self.similarity_threshold:
-                    self.logger.info(f"Cache hit with similarity {similarity:.2f}")
-                    return response
-                    
             return None
             
         except Exception as e:
             self.logger.error(f"Error retrieving from cache: {str(e)}")
             return None
             
-        finally:
-            conn.close()
-            
-    def add(self, prompt: str, response: str):
-        """Add new prompt-response pair to cache"""
+    def add(self, prompt: str, response: str, model: str = "", temperature: float = 0.7,
+            profile: Optional[str] = None):
+        """Add new prompt-response pair to its partition"""
         try:
-            embedding = self.get_embedding(prompt)
-            
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-            
-            cursor.execute(
-                "INSERT INTO cache (prompt, response, embedding) VALUES (?, ?, ?)",
-                (prompt, response, embedding.tobytes())
-            )
-            
-            conn.commit()
+            partition = self.partition_key(model, temperature, profile)
+            embedding = np.asarray(self.get_embedding(prompt), dtype=np.float32)
             
+            # Insert and append under the partition lock so a concurrent warm_partition
+            # either sees the new row in its SELECT or publishes before we append
+            with self.partition_lock(partition):
+                conn = sqlite3.connect(self.db_path)
+                try:
+                    cursor = conn.cursor()
+                    cursor.execute(
+                        "INSERT INTO cache (prompt, response, embedding, partition) VALUES (?, ?, ?, ?)",
+                        (prompt, response, embedding.tobytes(), partition)
+                    )
+                    conn.commit()
+                finally:
+                    conn.close()
+                    
+                with self.lock:
+                    if partition in self.partitions:
+                        matrix, responses = self.partitions[partition]
+                        row = self.normalize(embedding)[None, :]
+                        matrix = row if matrix is None else np.vstack([matrix, row])
+                        self.partitions[partition] = (matrix, responses + [response])
+                    
         except Exception as e:
             self.logger.error(f"Error adding to cache: {str(e)}")
             
-        finally:
-            conn.close()
-            
     def clear(self):
         """Clear all cached entries"""
+        with self.lock:
+            self.partitions.clear()
         try:
             conn = sqlite3.connect(self.db_path)
             cursor = conn.cursor()
@@ -105,4 +321,4 @@ class SemanticCache:
         except Exception as e:
             self.logger.error(f"Error clearing cache: {str(e)}")
         finally:
-            conn.close() 
\ No newline at end of file
+            conn.close()
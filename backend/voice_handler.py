@@ -4,8 +4,9 @@ import torch
 from utils.logger import setup_logger
 
 class VoiceHandler:
-    def __init__(self):
+    def __init__(self, governor=None):
         self.logger = setup_logger()
+        self.governor = governor
         self.setup_whisper()
         
     def setup_whisper(self):
@@ -14,11 +15,17 @@ class VoiceHandler:
             self.processor = WhisperProcessor.from_pretrained("openai/whisper-tiny")
             self.model = WhisperForConditionalGeneration.from_pretrained("openai/whisper-tiny")
             
-            if torch.cuda.is_available():
-                self.model = self.model.to("cuda")
-                self.logger.info("Whisper model loaded on GPU")
+            if self.governor is not None:
+                self.device = self.governor.whisper_device()
             else:
-                self.logger.info("Whisper model loaded on CPU")
+                self.device = "cuda" if torch.cuda.is_available() else "cpu"
+            if self.device == "cuda" and not torch.cuda.is_available():
+                self.device = "cpu"
+                
+            self.model = self.model.to(self.device)
+            if self.governor is not None and self.device == "cuda":
+                self.governor.mark_resident("whisper")
+            self.logger.info(f"Whisper model loaded on {'GPU' if self.device == 'cuda' else 'CPU'}")
                 
         except Exception as e:
             self.logger.error(f"Error loading Whisper model: {str(e)}")
@@ -47,8 +54,7 @@ class VoiceHandler:
                 return_tensors="pt"
             ).input_features
             
-            if torch.cuda.is_available():
-                input_features = input_features.to("cuda")
+            input_features = input_features.to(self.device)
                 
             # Generate transcription
             predicted_ids = self.model.generate(input_features)
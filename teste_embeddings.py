@@ -0,0 +1,76 @@
+import argparse
+import time
+import numpy as np
+from backend.embedding_backends import create_backend, BACKENDS
+
+# Frases de exemplo: pares parecidos e diferentes, como chegam ao cache semântico
+SENTENCES = [
+    "Como faço para instalar o Ollama no Windows?",
+    "Qual é o jeito de instalar o Ollama no Windows?",
+    "Explique o que é uma rede neural.",
+    "O que são redes neurais artificiais?",
+    "Me dê uma receita de bolo de cenoura.",
+    "How do I reverse a list in Python?",
+    "What is the fastest way to reverse a Python list?",
+    "Write a haiku about the ocean.",
+    "Quais são as capitais da América do Sul?",
+    "Resuma a história da Segunda Guerra Mundial.",
+    "Como configurar a GPU para o PyTorch?",
+    "Why is my CUDA out of memory?",
+]
+
+def similarity_matrix(embeddings: np.ndarray) -> np.ndarray:
+    embeddings = embeddings / np.linalg.norm(embeddings, axis=1, keepdims=True)
+    return embeddings @ embeddings.T
+
+def validate(reference, candidate, tolerance: float) -> bool:
+    ref = reference.encode(SENTENCES)
+    cand = candidate.encode(SENTENCES)
+    diff = np.abs(similarity_matrix(ref) - similarity_matrix(cand))
+    self_sim = np.sum(ref * cand, axis=1) / (np.linalg.norm(ref, axis=1) * np.linalg.norm(cand, axis=1))
+    print(f'Diferença máxima de similaridade: {diff.max():.4f} (tolerância {tolerance})')
+    print(f'Diferença média de similaridade:  {diff.mean():.4f}')
+    print(f'Cosseno mínimo entre embeddings:  {self_sim.min():.4f}')
+    # O cache compara consultas novas com embeddings gravados pelo outro backend,
+    # então a distância entre os dois também precisa ficar dentro da tolerância
+    return diff.max() <= tolerance and 1 - self_sim.min() <= tolerance
+
+def benchmark(backend, runs: int, batch_size: int):
+    backend.encode(SENTENCES[0])  # aquecimento
+    latencies = []
+    for i in range(runs):
+        start = time.perf_counter()
+        backend.encode(SENTENCES[i % len(SENTENCES)])
+        latencies.append((time.perf_counter() - start) * 1000)
+
+    batch = (SENTENCES * (batch_size // len(SENTENCES) + 1))[:batch_size]
+    start = time.perf_counter()
+    for _ in range(max(1, runs // 10)):
+        backend.encode(batch, batch_size=batch_size)
+    elapsed = time.perf_counter() - start
+    throughput = max(1, runs // 10) * batch_size / elapsed
+
+    print(f'  Latência p50: {np.percentile(latencies, 50):.2f} ms')
+    print(f'  Latência p95: {np.percentile(latencies, 95):.2f} ms')
+    print(f'  Vazão (lotes de {batch_size}): {throughput:.1f} frases/s')
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Valida e compara backends de embedding do cache semântico')
+    parser.add_argument('--backend', default='quantized', choices=sorted(BACKENDS))
+    parser.add_argument('--threads', type=int, default=None)
+    parser.add_argument('--tolerance', type=float, default=0.03)
+    parser.add_argument('--runs', type=int, default=100)
+    parser.add_argument('--batch-size', type=int, default=32)
+    args = parser.parse_args()
+
+    reference = create_backend('default', num_threads=args.threads)
+    candidate = create_backend(args.backend, num_threads=args.threads)
+
+    ok = validate(reference, candidate, args.tolerance)
+    print('Validação:', 'OK' if ok else 'FALHOU')
+
+    for name, backend in (('default', reference), (args.backend, candidate)):
+        print(f'Backend {name}:')
+        benchmark(backend, args.runs, args.batch_size)
+
+    raise SystemExit(0 if ok else 1)
@@ -0,0 +1,65 @@
+from backend.resource_governor import GB, FakeNVMLSource, ResourceGovernor, ResourceSampler
+
+# Simula uma GPU de 8GB sem NVIDIA: a memória livre acompanha o que os modelos ocupam
+source = FakeNVMLSource(gpu_total=8 * GB, gpu_free=2 * GB)
+sampler = ResourceSampler(source)
+governor = ResourceGovernor(sampler, vram_budget=6 * GB, cuda_available=True)
+
+def load_llm(layers: int, previous: int = 0):
+    """Ollama (re)carrega o modelo com `layers` camadas na GPU"""
+    source.gpu_free -= governor.llm_vram * (layers - previous) // governor.llm_layers
+    governor.mark_resident('llm:phi3-mini')
+    sampler.sample()
+
+# Pouca VRAM na inicialização: o modelo fica só parcialmente na GPU
+layers = governor.ollama_num_gpu('phi3-mini')
+print(f'Camadas na inicialização: {layers}/{governor.llm_layers}')
+assert 0 < layers < governor.llm_layers
+load_llm(layers)
+
+# Outro programa libera 1.5GB: deve haver exatamente um recarregamento, com todas as camadas
+source.gpu_free += int(1.5 * GB)
+reloads = 0
+for tick in range(5):
+    sampler.sample()
+    if governor.take_reload('phi3-mini'):
+        reloads += 1
+        new_layers = governor.ollama_num_gpu('phi3-mini')
+        load_llm(new_layers, layers)
+        layers = new_layers
+
+print(f'Recarregamentos: {reloads}, camadas finais: {layers}/{governor.llm_layers}')
+assert reloads == 1 and layers == governor.llm_layers
+
+# Workers de embedding na GPU e o modelo local (fallback) na CPU: cada ciclo do amostrador
+# reavalia os dois, e a VRAM disponível não pode encolher por contagem dupla
+source = FakeNVMLSource(gpu_total=6 * GB, gpu_free=6 * GB)
+sampler = ResourceSampler(source)
+governor = ResourceGovernor(sampler, vram_budget=6 * GB, cuda_available=True)
+governor.ollama_num_gpu('phi3-mini')
+assert governor.embedding_device(name='embedding:service') == 'cuda'
+source.gpu_free -= governor.llm_vram + governor.embedding_vram
+governor.mark_resident('llm:phi3-mini')
+governor.mark_resident('embedding:service')
+sampler.sample()
+usable = governor.usable_vram()
+for tick in range(5):
+    governor.embedding_device('cpu', name='embedding:local')
+    governor.embedding_device('cuda', name='embedding:service')
+    sampler.sample()
+print(f'VRAM utilizável: {usable // (1024 * 1024)}MB -> {governor.usable_vram() // (1024 * 1024)}MB')
+assert governor.usable_vram() == usable
+
+# Falha de leitura do NVML depois da inicialização: o Ollama decide, e nada fica fixado
+source = FakeNVMLSource(gpu_total=6 * GB, gpu_free=6 * GB)
+sampler = ResourceSampler(source)
+governor = ResourceGovernor(sampler, cuda_available=True)
+source.gpu_total = source.gpu_free = 0
+sampler.sample()
+assert governor.ollama_num_gpu('phi3-mini') is None
+source.gpu_total = source.gpu_free = 6 * GB
+sampler.sample()
+print(f'Camadas após leitura falha e recuperada: {governor.ollama_num_gpu("phi3-mini")}/{governor.llm_layers}')
+assert governor.ollama_num_gpu('phi3-mini') == governor.llm_layers
+
+print('OK')
@@ -13,7 +13,15 @@ class Config:
             "cache_enabled": True,
             "max_tokens": 2048,
             "temperature": 0.7,
-            "voice_enabled": True
+            "voice_enabled": True,
+            "model_name": "phi3-mini",
+            "keep_alive": "30m",
+            "warmup_on_start": True,
+            "embedding_workers": 1,
+            "embedding_batch_window_ms": 5,
+            "embedding_backend": "default",
+            "embedding_threads": 0,
+            "vram_budget_gb": 6
         }
         self.config = self.load_config()
         
@@ -83,4 +91,36 @@ class Config:
     def set_voice_enabled(self, enabled: bool):
         """Enable/disable voice input"""
         self.config["voice_enabled"] = enabled
-        self.save_config(self.config) 
\ No newline at end of file
+        self.save_config(self.config)
+        
+    def get_model_name(self) -> str:
+        """Get configured Ollama model"""
+        return self.config.get("model_name", "phi3-mini")
+        
+    def get_keep_alive(self):
+        """Get how long Ollama keeps the model loaded (e.g. "30m", -1 for forever)"""
+        return self.config.get("keep_alive", "30m")
+        
+    def is_warmup_enabled(self) -> bool:
+        """Check if model should be preloaded at startup"""
+        return self.config.get("warmup_on_start", True)
+        
+    def get_embedding_workers(self) -> int:
+        """Get number of embedding worker processes (0 encodes in-process)"""
+        return self.config.get("embedding_workers", 1)
+        
+    def get_embedding_batch_window(self) -> float:
+        """Get how long (ms) the embedding workers wait to micro-batch requests"""
+        return self.config.get("embedding_batch_window_ms", 5)
+        
+    def get_embedding_backend(self) -> str:
+        """Get embedding backend ("default" or "quantized" int8 CPU)"""
+        return self.config.get("embedding_backend", "default")
+        
+    def get_embedding_threads(self) -> int:
+        """Get CPU threads per embedding process (0 picks automatically)"""
+        return self.config.get("embedding_threads", 0)
+        
+    def get_vram_budget(self) -> float:
+        """Get how much VRAM (GB) the app may use for its models"""
+        return self.config.get("vram_budget_gb", 6)